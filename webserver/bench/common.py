@@ -0,0 +1,27 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+
+
+def percentile(sorted_values, pct):
+	if not sorted_values:
+		return 0.0
+	index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+	return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+	"""
+	Latency percentiles (in milliseconds) and throughput for a list of request
+	latencies in seconds collected over elapsed seconds.
+	"""
+	latencies = sorted(latencies)
+	return {
+		"requests": len(latencies),
+		"errors": errors,
+		"throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+		"mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+		"p50_ms": percentile(latencies, 50) * 1000,
+		"p95_ms": percentile(latencies, 95) * 1000,
+		"p99_ms": percentile(latencies, 99) * 1000,
+	}
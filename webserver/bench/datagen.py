@@ -0,0 +1,200 @@
+"""
+Generates a synthetic 311 dataset in a local Postgres for benchmarking.
+
+    DATABASEURI=postgresql://postgres@localhost/bench python bench/datagen.py --scale 10m --reset
+
+--scale picks 1m, 10m or 50m complaints (--complaints sets any other number).
+The data is skewed roughly like the real thing: a few agencies (NYPD, HPD)
+get most complaints, some neighborhoods get many more than others, each
+agency has its own typical time to close (minutes for homeless outreach,
+weeks for the TLC) with a log-normal spread, recent years have more
+complaints than early ones, and about 5% of complaints are still open.
+
+Complaints are generated inside Postgres with generate_series, a million at a
+time, so 50m rows take minutes rather than hours. The output only depends on
+--seed. Afterwards the rollups are rebuilt so every route has data to serve.
+
+It applies the migrations first and refuses to touch a database that already
+has complaints unless --reset is given, which empties the 311 tables.
+"""
+import os
+import random
+import sys
+import time
+
+import click
+import psycopg
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import migrate
+import rollup
+
+SCALES = {"1m": 1000000, "10m": 10000000, "50m": 50000000}
+
+CHUNK = 1000000
+
+# acronym, name, share of complaints, median hours to close, complaint types (most common first)
+AGENCIES = [
+	("NYPD", "New York City Police Department", 0.34, 3,
+		["Noise - Residential", "Illegal Parking", "Blocked Driveway", "Noise - Street/Sidewalk"]),
+	("HPD", "Department of Housing Preservation and Development", 0.18, 120,
+		["HEAT/HOT WATER", "UNSANITARY CONDITION", "PLUMBING", "PAINT/PLASTER"]),
+	("DSNY", "Department of Sanitation", 0.10, 48,
+		["Dirty Condition", "Missed Collection", "Illegal Dumping", "Derelict Vehicles"]),
+	("DOT", "Department of Transportation", 0.09, 72,
+		["Street Condition", "Street Light Condition", "Traffic Signal Condition", "Sidewalk Condition"]),
+	("DEP", "Department of Environmental Protection", 0.08, 96,
+		["Water System", "Noise", "Sewer", "Air Quality"]),
+	("DOB", "Department of Buildings", 0.06, 240,
+		["General Construction/Plumbing", "Building/Use", "Elevator", "Illegal Conversion"]),
+	("DPR", "Department of Parks and Recreation", 0.06, 168,
+		["Damaged Tree", "New Tree Request", "Overgrown Tree/Branches", "Dead/Dying Tree"]),
+	("DOHMH", "Department of Health and Mental Hygiene", 0.04, 200,
+		["Rodent", "Food Establishment", "Standing Water", "Indoor Air Quality"]),
+	("DHS", "Department of Homeless Services", 0.03, 2,
+		["Homeless Person Assistance", "Encampment", "Homeless Street Condition", "Shelter"]),
+	("TLC", "Taxi and Limousine Commission", 0.02, 500,
+		["For Hire Vehicle Complaint", "Taxi Complaint", "Lost Property", "Taxi Report"]),
+]
+
+# community boards per borough
+BOROUGHS = [("MANHATTAN", 12), ("BRONX", 12), ("BROOKLYN", 18), ("QUEENS", 14), ("STATEN ISLAND", 3)]
+
+STATUSES = ["Closed", "Open"]
+
+FIRST_DAY = "2010-01-01"
+LAST_DAY = "2025-01-01"
+
+TABLES_311 = ["complaint", "address", "neighborhood", "status", "complaint_type", "agency",
+	"resolution_daily", "resolution_summary", "rollup_dirty_day", "rollup_state", "import_checkpoint"]
+
+
+def neighborhoods(seed):
+	"""
+	All community boards as (name, borough), shuffled so the busiest ones are spread over the boroughs.
+	"""
+	boards = []
+	for borough, count in BOROUGHS:
+		for number in range(1, count + 1):
+			boards.append(("%02d %s" % (number, borough), borough))
+	random.Random(seed).shuffle(boards)
+	return boards
+
+
+def complaint_sql(per_neighborhood, n_neighborhoods):
+	"""
+	INSERT ... SELECT that generates the complaints with ids in [%(lo)s, %(hi)s).
+	"""
+	agency_case = []
+	cumulative = 0.0
+	for index, agency in enumerate(AGENCIES[:-1], start=1):
+		cumulative += agency[2]
+		agency_case.append("WHEN ra < %r THEN %d" % (cumulative, index))
+	medians = ", ".join(str(float(a[3])) for a in AGENCIES)
+	return """
+	INSERT INTO complaint (complaint_id, created_date, closed_date, agency_id, complaint_type_id,
+		address_id, neighborhood_id, status_id)
+	SELECT id, created_date,
+		CASE WHEN is_closed THEN created_date + make_interval(secs => h.hours * 3600) END,
+		agency_id,
+		(agency_id - 1) * 4 + 1 + floor(4 * power(rt, 2))::int,
+		(neighborhood_id - 1) * %(per)d + 1 + floor(%(per)d * rd)::int,
+		neighborhood_id,
+		CASE WHEN is_closed THEN 1 ELSE 2 END
+	FROM (
+		SELECT id,
+			timestamp '%(first)s' + sqrt(rc) * (timestamp '%(last)s' - timestamp '%(first)s') AS created_date,
+			CASE %(agency_case)s ELSE %(n_agencies)d END AS agency_id,
+			1 + floor(%(n_neighborhoods)d * power(rn, 1.6))::int AS neighborhood_id,
+			rs < 0.95 AS is_closed,
+			rt, rd, u1, u2
+		FROM (
+			SELECT id, random() AS ra, random() AS rc, random() AS rn, random() AS rs,
+				random() AS rt, random() AS rd, random() AS u1, random() AS u2
+			FROM generate_series(%%(lo)s::bigint, %%(hi)s::bigint - 1) id
+		) r
+	) s
+	CROSS JOIN LATERAL (
+		SELECT exp(ln((ARRAY[%(medians)s])[agency_id]) + 1.2 * sqrt(-2 * ln(greatest(u1, 1e-12))) * cos(2 * pi() * u2)) AS hours
+	) h
+	""" % {
+		"per": per_neighborhood,
+		"first": FIRST_DAY,
+		"last": LAST_DAY,
+		"agency_case": " ".join(agency_case),
+		"n_agencies": len(AGENCIES),
+		"n_neighborhoods": n_neighborhoods,
+		"medians": medians,
+	}
+
+
+def load_dimensions(conn, boards, per_neighborhood):
+	with conn.cursor() as cur:
+		for agency_id, (acronym, name, _, _, types) in enumerate(AGENCIES, start=1):
+			cur.execute("INSERT INTO agency (agency_id, acronym, name) VALUES (%s, %s, %s)", (agency_id, acronym, name))
+			for offset, type_name in enumerate(types, start=1):
+				cur.execute("INSERT INTO complaint_type (complaint_type_id, name) VALUES (%s, %s)",
+					((agency_id - 1) * 4 + offset, type_name))
+		for status_id, name in enumerate(STATUSES, start=1):
+			cur.execute("INSERT INTO status (status_id, name) VALUES (%s, %s)", (status_id, name))
+		for neighborhood_id, (name, borough) in enumerate(boards, start=1):
+			cur.execute("INSERT INTO neighborhood (neighborhood_id, name, borough) VALUES (%s, %s, %s)",
+				(neighborhood_id, name, borough))
+		# per_neighborhood addresses for each neighborhood, numbered in neighborhood order
+		cur.execute("""
+			INSERT INTO address (address_id, street_address, zip, neighborhood_id)
+			SELECT (n - 1) * %(per)s + k, k || ' SYNTHETIC STREET', lpad((10000 + n)::text, 5, '0'), n
+			FROM generate_series(1, %(neighborhoods)s) n, generate_series(1, %(per)s) k
+		""", {"per": per_neighborhood, "neighborhoods": len(boards)})
+		for table, column in (("agency", "agency_id"), ("complaint_type", "complaint_type_id"),
+				("status", "status_id"), ("neighborhood", "neighborhood_id"), ("address", "address_id")):
+			cur.execute("SELECT setval(pg_get_serial_sequence(%s, %s), (SELECT max({0}) FROM {1}))".format(column, table),
+				(table, column))
+
+
+@click.command()
+@click.option('--scale', type=click.Choice(sorted(SCALES)), default='1m', help='Number of complaints.')
+@click.option('--complaints', type=int, help='Exact number of complaints, instead of --scale.')
+@click.option('--seed', default=311, help='Random seed; the same seed gives the same data.')
+@click.option('--reset', is_flag=True, help='Empty the 311 tables first.')
+def main(scale, complaints, seed, reset):
+	uri = os.environ.get("DATABASEURI")
+	if not uri:
+		raise click.ClickException("set DATABASEURI to the benchmark database")
+	total = complaints or SCALES[scale]
+	boards = neighborhoods(seed)
+	per_neighborhood = max(1, total // 20 // len(boards))
+
+	migrate.migrate(uri)
+	with psycopg.connect(migrate.conninfo(uri)) as conn:
+		if conn.execute("SELECT EXISTS (SELECT 1 FROM complaint)").fetchone()[0]:
+			if not reset:
+				raise click.ClickException("the database already has complaints, use --reset to replace them")
+		if reset:
+			conn.execute("TRUNCATE %s RESTART IDENTITY CASCADE" % ", ".join(TABLES_311))
+		load_dimensions(conn, boards, per_neighborhood)
+		conn.commit()
+
+		# one session, no parallel workers: random() then follows setseed() exactly
+		conn.execute("SET max_parallel_workers_per_gather = 0")
+		conn.execute("SELECT setseed(%s)", (random.Random(seed).uniform(-1, 1),))
+		insert = complaint_sql(per_neighborhood, len(boards))
+		start = time.perf_counter()
+		for lo in range(1, total + 1, CHUNK):
+			hi = min(total + 1, lo + CHUNK)
+			conn.execute(insert, {"lo": lo, "hi": hi})
+			conn.commit()
+			print("%d/%d complaints (%.0fs)" % (hi - 1, total, time.perf_counter() - start))
+		conn.execute("ANALYZE")
+		conn.commit()
+
+	engine = create_engine(uri)
+	with engine.connect() as conn:
+		days = rollup.refresh(conn, full=True)
+	engine.dispose()
+	print("rebuilt rollups for %d days in %.0fs total" % (days, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+	main()
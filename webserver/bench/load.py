@@ -0,0 +1,215 @@
+"""
+Concurrent HTTP load benchmark for the web routes.
+
+Start the server against a database filled by datagen.py, then drive it:
+
+    DATABASEURI=postgresql://postgres@localhost/bench python server.py serve 127.0.0.1 8111
+    python bench/load.py --url http://127.0.0.1:8111 --concurrency 16 --duration 30 --output results.json
+
+Each client thread keeps one HTTP connection open and sends requests picked at
+random from ENDPOINTS, with agencies, neighborhoods and complaint types taken
+from the synthetic dataset. Requests made during the --warmup seconds are not
+counted. The results (p50/p95/p99 latency, throughput and errors per
+endpoint) are printed and, with --output, written as JSON.
+
+The server's query cache answers most /stats and API requests from memory
+once it is warm, so index, rollup or query changes barely show up in the
+numbers. To measure those, start the server with the cache turned off:
+
+    QUERY_CACHE_MAX_BYTES=0 DATABASEURI=... python server.py serve 127.0.0.1 8111
+
+The cache budget the server reports on /metrics is recorded in the results,
+and a run is only compared with a baseline taken with the same setting.
+
+To gate a change, compare against the results of an earlier run:
+
+    python bench/load.py ... --baseline before.json --max-regression 0.10
+
+exits with status 1 if any endpoint's p95 latency grew, or its throughput
+shrank, by more than 10%.
+"""
+import http.client
+import json
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote, urlencode, urlsplit
+
+import click
+
+import datagen
+from common import summarize
+
+AGENCY_NAMES = [a[0] for a in datagen.AGENCIES]
+COMPLAINT_TYPES = [t for a in datagen.AGENCIES for t in a[4]]
+NEIGHBORHOOD_NAMES = [n for n, _ in datagen.neighborhoods(311)]
+
+
+def path(route, **args):
+	return route + ("?" + urlencode(args, doseq=True, quote_via=quote) if args else "")
+
+
+def random_cursor(rng):
+	# a position somewhere in the listing, to measure pages deep into it
+	day = datetime(2011, 1, 1) + (datetime(2024, 12, 1) - datetime(2011, 1, 1)) * rng.random()
+	return "%s~0" % day.replace(microsecond=0).isoformat()
+
+
+# name -> function building a request path from a random number generator
+ENDPOINTS = {
+	"index": lambda rng: "/",
+	"stats_by_agency": lambda rng: path("/stats", by="agency"),
+	"stats_neighborhood_by_type": lambda rng: path("/stats", by="complaint_type", neighborhood=rng.choice(NEIGHBORHOOD_NAMES)),
+	"complaints_first_page": lambda rng: path("/complaints", neighborhood=rng.choice(NEIGHBORHOOD_NAMES)),
+	"complaints_deep_page": lambda rng: path("/complaints", agency=rng.choice(AGENCY_NAMES), after=random_cursor(rng)),
+	"api_stats": lambda rng: path("/api/v1/stats", by="neighborhood", agency=rng.choice(AGENCY_NAMES)),
+	"api_stats_batch": lambda rng: path("/api/v1/stats/batch",
+		agency=rng.sample(AGENCY_NAMES, 3), neighborhood=rng.sample(NEIGHBORHOOD_NAMES, 5),
+		complaint_type=rng.sample(COMPLAINT_TYPES, 2)),
+}
+
+
+def client(url, names, deadline, counting_from, seed, results, lock):
+	"""
+	Sends requests until deadline and adds (endpoint, seconds, ok) for those
+	started after counting_from to results.
+	"""
+	rng = random.Random(seed)
+	parts = urlsplit(url)
+	conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+	mine = []
+	while time.perf_counter() < deadline:
+		name = rng.choice(names)
+		request_path = ENDPOINTS[name](rng)
+		start = time.perf_counter()
+		try:
+			conn.request("GET", request_path)
+			response = conn.getresponse()
+			response.read()
+			ok = response.status < 400
+		except (OSError, http.client.HTTPException):
+			ok = False
+			conn.close()
+			conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+		if start >= counting_from:
+			mine.append((name, time.perf_counter() - start, ok))
+	conn.close()
+	with lock:
+		results.extend(mine)
+
+
+def query_cache_max_bytes(url):
+	"""
+	The query cache budget the server at url reports on /metrics, or None if it can't be read.
+	"""
+	parts = urlsplit(url)
+	conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+	try:
+		conn.request("GET", "/metrics")
+		body = conn.getresponse().read().decode()
+	except (OSError, http.client.HTTPException):
+		return None
+	finally:
+		conn.close()
+	for line in body.splitlines():
+		if line.startswith("query_cache_max_bytes "):
+			return int(float(line.split()[1]))
+	return None
+
+
+def git_revision():
+	try:
+		return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def regressions(results, baseline, max_regression):
+	"""
+	Returns a message for every endpoint that got slower or slower-serving than baseline allows.
+	"""
+	found = []
+	for name, now in results["endpoints"].items():
+		before = baseline.get("endpoints", {}).get(name)
+		if before is None:
+			continue
+		if before["p95_ms"] > 0 and now["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+			found.append("%s: p95 %.1fms -> %.1fms" % (name, before["p95_ms"], now["p95_ms"]))
+		if now["throughput_rps"] < before["throughput_rps"] * (1 - max_regression):
+			found.append("%s: throughput %.1f -> %.1f req/s" % (name, before["throughput_rps"], now["throughput_rps"]))
+	return found
+
+
+@click.command()
+@click.option('--url', default='http://127.0.0.1:8111', help='Server to benchmark.')
+@click.option('--concurrency', default=8, help='Client threads.')
+@click.option('--duration', default=30.0, help='Seconds to measure for.')
+@click.option('--warmup', default=5.0, help='Seconds of load before measuring starts.')
+@click.option('--endpoint', 'endpoints', multiple=True, type=click.Choice(sorted(ENDPOINTS)),
+	help='Only drive these endpoints (repeatable). Default: all of them.')
+@click.option('--seed', default=311, help='Random seed for the request mix.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results to this JSON file.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Results of an earlier run to compare with.')
+@click.option('--max-regression', default=0.10, help='Allowed relative regression against --baseline.')
+def main(url, concurrency, duration, warmup, endpoints, seed, output, baseline, max_regression):
+	names = sorted(endpoints or ENDPOINTS)
+	cache_bytes = query_cache_max_bytes(url)
+	if baseline:
+		with open(baseline) as f:
+			baseline_report = json.load(f)
+		baseline_cache_bytes = baseline_report.get("meta", {}).get("query_cache_max_bytes")
+		if baseline_cache_bytes != cache_bytes:
+			raise click.ClickException("%s was recorded with query_cache_max_bytes=%s but the server has %s; "
+				"compare runs with the same cache setting" % (baseline, baseline_cache_bytes, cache_bytes))
+	results = []
+	lock = threading.Lock()
+	counting_from = time.perf_counter() + warmup
+	deadline = counting_from + duration
+	threads = [threading.Thread(target=client, args=(url, names, deadline, counting_from, seed + i, results, lock))
+		for i in range(concurrency)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+
+	report = {
+		"meta": {
+			"url": url,
+			"concurrency": concurrency,
+			"duration_s": duration,
+			"warmup_s": warmup,
+			"seed": seed,
+			"query_cache_max_bytes": cache_bytes,
+			"git_revision": git_revision(),
+			"finished_at": datetime.now(timezone.utc).isoformat(),
+		},
+		"endpoints": {},
+	}
+	for name in names:
+		mine = [r for r in results if r[0] == name]
+		report["endpoints"][name] = summarize([r[1] for r in mine if r[2]], duration, errors=sum(1 for r in mine if not r[2]))
+	report["total"] = summarize([r[1] for r in results if r[2]], duration, errors=sum(1 for r in results if not r[2]))
+
+	print("%-28s %9s %7s %9s %9s %9s %9s" % ("endpoint", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+	for name, r in list(report["endpoints"].items()) + [("total", report["total"])]:
+		print("%-28s %9d %7d %9.1f %9.2f %9.2f %9.2f" % (
+			name, r["requests"], r["errors"], r["throughput_rps"], r["p50_ms"], r["p95_ms"], r["p99_ms"]))
+
+	if output:
+		with open(output, "w") as f:
+			json.dump(report, f, indent=2)
+
+	if baseline:
+		found = regressions(report, baseline_report, max_regression)
+		if found:
+			print("regressions against %s:" % baseline)
+			for message in found:
+				print("  " + message)
+			raise SystemExit(1)
+		print("no regressions against %s" % baseline)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,84 @@
+"""
+Load benchmark for the connection pool.
+
+Drives the / route through Flask's test client from several threads, first with
+DATABASE_POOL_MODE=null (a fresh connection per request, the old behaviour) and
+then with the queue pool, and prints the latency of each. The query cache is
+turned off so every request checks out a connection. Point it at a local
+Postgres stand-in rather than the class server, e.g.
+
+    DATABASEURI=postgresql://postgres@localhost/proj1part2 python bench/pool.py --threads 8 --requests 200
+
+Use --json to get the numbers as JSON instead of a table.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+import click
+
+from common import summarize
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import server
+
+
+def drive(path, threads, requests_per_thread):
+	"""
+	Sends requests_per_thread GETs to path from each thread and returns the
+	per-request latencies in seconds plus the wall-clock time of the whole run.
+	"""
+	latencies = []
+	lock = threading.Lock()
+
+	def worker():
+		client = server.app.test_client()
+		mine = []
+		for _ in range(requests_per_thread):
+			start = time.perf_counter()
+			response = client.get(path)
+			mine.append(time.perf_counter() - start)
+			if response.status_code != 200:
+				raise RuntimeError("%s returned %d" % (path, response.status_code))
+		with lock:
+			latencies.extend(mine)
+
+	workers = [threading.Thread(target=worker) for _ in range(threads)]
+	start = time.perf_counter()
+	for w in workers:
+		w.start()
+	for w in workers:
+		w.join()
+	return latencies, time.perf_counter() - start
+
+
+@click.command()
+@click.option('--threads', default=8, help='Concurrent clients.')
+@click.option('--requests', 'requests_per_thread', default=100, help='Requests sent by each client.')
+@click.option('--path', default='/', help='Route to request.')
+@click.option('--json', 'as_json', is_flag=True, help='Print results as JSON.')
+def main(threads, requests_per_thread, path, as_json):
+	# with the query cache on, / is answered from memory without checking out a connection
+	server.QUERY_CACHE_MAX_BYTES = server.query_cache.max_bytes = 0
+	results = []
+	for mode in ("null", "queue"):
+		server.engine.dispose()
+		server.engine = server.make_engine(mode=mode)
+		drive(path, 1, 5)  # warm up templates and, for the queue pool, a first connection
+		latencies, elapsed = drive(path, threads, requests_per_thread)
+		results.append(dict(pool_mode=mode, **summarize(latencies, elapsed)))
+	server.engine.dispose()
+
+	if as_json:
+		print(json.dumps(results, indent=2))
+		return
+	print("%-6s %9s %10s %9s %9s %9s" % ("mode", "requests", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+	for r in results:
+		print("%-6s %9d %10.1f %9.2f %9.2f %9.2f" % (
+			r["pool_mode"], r["requests"], r["throughput_rps"], r["p50_ms"], r["p95_ms"], r["p99_ms"]))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,148 @@
+"""
+In-process cache for the results of read queries.
+
+Entries are keyed by the query text (with whitespace normalized) and its
+parameters, and are tagged with the tables the query reads. An entry goes
+away when
+
+  - its time to live runs out (each route picks its own TTL),
+  - the cache grows past its memory budget and the entry is the least
+    recently used one, or
+  - one of its tables is invalidated because something wrote to it.
+
+Writes in this process call invalidate() directly. Writes from other
+processes (the bulk importer, refresh-rollups, other server workers) send
+NOTIFY query_cache, '<table>' in their transaction; listen() runs a thread
+that receives those and invalidates the matching entries.
+"""
+import logging
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg
+
+import metrics
+
+CHANNEL = "query_cache"
+
+log = logging.getLogger(__name__)
+
+HITS = metrics.Counter("query_cache_hits_total", "Read queries answered from the cache.")
+MISSES = metrics.Counter("query_cache_misses_total", "Read queries that had to go to the database.")
+EVICTIONS = metrics.Counter("query_cache_evictions_total", "Entries dropped to stay within the memory budget.")
+INVALIDATIONS = metrics.Counter("query_cache_invalidations_total", "Entries dropped because a table they read was written to.")
+
+
+def normalize_query(query):
+	return re.sub(r"\s+", " ", query).strip()
+
+
+def make_key(query, params):
+	items = []
+	for name, value in sorted((params or {}).items()):
+		# lists (e.g. for = ANY(:names)) aren't hashable
+		items.append((name, tuple(value) if isinstance(value, list) else value))
+	return normalize_query(query), tuple(items)
+
+
+class QueryCache:
+	"""
+	LRU cache of query results bounded by max_bytes. Sizes are estimated from
+	the pickled result, so the budget is approximate.
+	"""
+
+	def __init__(self, max_bytes):
+		self.max_bytes = max_bytes
+		self.bytes = 0
+		self._entries = OrderedDict()  # key -> (value, size, expires_at, tables)
+		self._lock = threading.Lock()
+		# bumped by every invalidation, so a result computed while one happened isn't stored
+		self._generation = 0
+
+	def __len__(self):
+		return len(self._entries)
+
+	def fetch(self, query, params, compute, ttl, tables):
+		"""
+		Returns the cached result of query/params, or calls compute() and caches
+		what it returns for ttl seconds, tagged with tables.
+		"""
+		if self.max_bytes <= 0 or ttl <= 0:
+			return compute()
+		key = make_key(query, params)
+		now = time.monotonic()
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None and entry[2] > now:
+				self._entries.move_to_end(key)
+				HITS.inc()
+				return entry[0]
+			generation = self._generation
+		MISSES.inc()
+		value = compute()
+		self.put(key, value, now + ttl, tables, generation)
+		return value
+
+	def put(self, key, value, expires_at, tables, generation):
+		size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+		if size > self.max_bytes:
+			return
+		with self._lock:
+			if generation != self._generation:
+				return
+			self._discard(key)
+			self._entries[key] = (value, size, expires_at, frozenset(tables))
+			self.bytes += size
+			while self.bytes > self.max_bytes:
+				oldest = next(iter(self._entries))
+				self._discard(oldest)
+				EVICTIONS.inc()
+
+	def invalidate(self, *tables):
+		"""
+		Drops every entry that reads one of tables.
+		"""
+		tables = set(tables)
+		with self._lock:
+			self._generation += 1
+			stale = [key for key, entry in self._entries.items() if entry[3] & tables]
+			for key in stale:
+				self._discard(key)
+		INVALIDATIONS.inc(len(stale))
+
+	def clear(self):
+		with self._lock:
+			self._generation += 1
+			self._entries.clear()
+			self.bytes = 0
+
+	def _discard(self, key):
+		entry = self._entries.pop(key, None)
+		if entry is not None:
+			self.bytes -= entry[1]
+
+
+def listen(conninfo, cache, retry_seconds=5):
+	"""
+	Starts a daemon thread that invalidates cache entries when a NOTIFY arrives
+	on the query_cache channel. The cache is cleared whenever the thread
+	(re)connects, since notifications sent while it was away are lost.
+	"""
+	def loop():
+		while True:
+			try:
+				with psycopg.connect(conninfo, autocommit=True) as conn:
+					conn.execute("LISTEN %s" % CHANNEL)
+					cache.clear()
+					for n in conn.notifies():
+						cache.invalidate(n.payload)
+			except Exception:
+				log.exception("query cache listener lost its connection, retrying in %ds", retry_seconds)
+			time.sleep(retry_seconds)
+
+	thread = threading.Thread(target=loop, name="query-cache-listener", daemon=True)
+	thread.start()
+	return thread
@@ -0,0 +1,90 @@
+"""
+Complaint listings with keyset pagination.
+
+Complaints are listed newest first, ordered by (created_date, complaint_id).
+Instead of OFFSET, the next page starts after the last complaint of the
+previous one; its position is passed around as an opaque cursor string like
+"2024-01-15T22:30:00~58723311". With an index on (created_date, complaint_id)
+every page costs the same, however deep into the listing it is.
+
+stream_listing() reads the page through a server-side cursor and yields rows
+one at a time, so together with Flask's stream_template a page is sent while
+it is being read instead of being collected in memory first.
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 5000
+
+# rows fetched from the server-side cursor at a time
+FETCH_SIZE = 500
+
+# Filters compare with a subquery's result rather than IN (SELECT ...), so the
+# planner can read the (agency_id or neighborhood_id, created_date) index
+# instead of filtering the whole table newest first. A neighborhood name can
+# exist under several boroughs (like '0 Unspecified'), so it is matched with
+# = ANY (ARRAY(...)), which takes every one of them, as the rollups do.
+FILTERS = {
+	"agency": "c.agency_id = (SELECT agency_id FROM agency WHERE acronym = :agency)",
+	"complaint_type": "c.complaint_type_id = (SELECT complaint_type_id FROM complaint_type WHERE name = :complaint_type)",
+	"neighborhood": "c.neighborhood_id = ANY (ARRAY(SELECT neighborhood_id FROM neighborhood WHERE name = :neighborhood))",
+}
+
+
+def encode_cursor(created_date, complaint_id):
+	return "%s~%d" % (created_date.isoformat(), complaint_id)
+
+
+def decode_cursor(cursor):
+	"""
+	Returns (created_date, complaint_id) for a cursor, raising ValueError if it is malformed.
+	"""
+	created_date, complaint_id = cursor.rsplit("~", 1)
+	return datetime.fromisoformat(created_date), int(complaint_id)
+
+
+def listing_query(after=None, limit=DEFAULT_PAGE_SIZE, **filters):
+	"""
+	Builds the query for one page of complaints. filters may contain agency,
+	complaint_type and neighborhood; after is a cursor. Returns (query, params).
+	"""
+	where = []
+	params = {"limit": limit}
+	for name, value in filters.items():
+		if value is not None:
+			where.append(FILTERS[name])
+			params[name] = value
+	if after is not None:
+		params["after_date"], params["after_id"] = decode_cursor(after)
+		where.append("(c.created_date, c.complaint_id) < (:after_date, :after_id)")
+	query = """
+	SELECT c.complaint_id, c.created_date, c.closed_date, a.acronym AS agency, t.name AS complaint_type,
+		s.name AS status, ad.street_address, n.name AS neighborhood
+	FROM complaint c
+	JOIN agency a ON a.agency_id = c.agency_id
+	JOIN complaint_type t ON t.complaint_type_id = c.complaint_type_id
+	LEFT JOIN status s ON s.status_id = c.status_id
+	LEFT JOIN address ad ON ad.address_id = c.address_id
+	LEFT JOIN neighborhood n ON n.neighborhood_id = c.neighborhood_id
+	%s
+	ORDER BY c.created_date DESC, c.complaint_id DESC
+	LIMIT :limit
+	""" % (("WHERE " + " AND ".join(where)) if where else "")
+	return query, params
+
+
+def stream_listing(conn, after=None, limit=DEFAULT_PAGE_SIZE, **filters):
+	"""
+	Yields one page of complaints as dicts, each with the cursor that starts the page after it.
+	"""
+	query, params = listing_query(after, limit, **filters)
+	result = conn.execution_options(stream_results=True, yield_per=FETCH_SIZE).execute(text(query), params)
+	try:
+		for row in result:
+			complaint = row._asdict()
+			complaint["cursor"] = encode_cursor(row.created_date, row.complaint_id)
+			yield complaint
+	finally:
+		result.close()
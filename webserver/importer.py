@@ -0,0 +1,359 @@
+"""
+Bulk importer for the NYC "311 Service Requests from 2010 to Present" dataset.
+
+Run it through server.py:
+
+    python server.py import 311_Service_Requests.csv
+    python server.py import erm2-nwe9.json --new-only
+
+The export is streamed record by record, so memory use only depends on the
+batch size. Each batch is COPYed into a temporary staging table and then
+normalized into the agency, complaint_type, status, neighborhood, address and
+complaint tables with a handful of set-based INSERT ... SELECT statements.
+
+After every batch the number of records read is saved in import_checkpoint in
+the same transaction, so an interrupted import picks up where it stopped when
+it is run again. The checkpoint also records the file's size and modification
+time, so a new export saved under the same name is read from the start, and
+the since the import started with, which a resumed import keeps. It is
+removed once the whole file is loaded.
+
+CSV exports from the Open Data portal ("Unique Key", "Created Date", ...) and
+JSON exports from the SODA API (unique_key, created_date, ...) are both
+understood; JSON may be a single array of objects or one object per line.
+"""
+import csv
+import json
+import os
+from datetime import datetime
+
+import psycopg
+
+import migrate
+
+# columns of the staging table, in COPY order
+STAGING_COLUMNS = [
+	"unique_key", "created_date", "closed_date", "agency", "agency_name",
+	"complaint_type", "descriptor", "status", "resolution_description",
+	"incident_address", "incident_zip", "borough", "community_board",
+	"latitude", "longitude",
+]
+
+CREATE_STAGING = """
+CREATE TEMP TABLE IF NOT EXISTS staging_311 (
+	unique_key bigint,
+	created_date timestamp,
+	closed_date timestamp,
+	agency text,
+	agency_name text,
+	complaint_type text,
+	descriptor text,
+	status text,
+	resolution_description text,
+	incident_address text,
+	incident_zip text,
+	borough text,
+	community_board text,
+	latitude double precision,
+	longitude double precision
+) ON COMMIT DELETE ROWS
+"""
+
+# Run in order after each COPY. DISTINCT ON keeps one row per key so that a
+# complaint repeated inside a batch doesn't trip ON CONFLICT DO UPDATE.
+NORMALIZE = [
+	# Imports share the lock rollup.refresh() takes exclusively. A refresh that
+	# ran while this batch was open could otherwise clear a day it marks dirty
+	# and recompute it without the batch's complaints.
+	"SELECT pg_advisory_xact_lock_shared(hashtext('rollup.refresh'))",
+	"""
+	INSERT INTO agency (acronym, name)
+	SELECT DISTINCT ON (agency) agency, agency_name FROM staging_311 ORDER BY agency
+	ON CONFLICT (acronym) DO NOTHING
+	""",
+	"""
+	INSERT INTO complaint_type (name)
+	SELECT DISTINCT complaint_type FROM staging_311
+	ON CONFLICT (name) DO NOTHING
+	""",
+	"""
+	INSERT INTO status (name)
+	SELECT DISTINCT status FROM staging_311 WHERE status IS NOT NULL
+	ON CONFLICT (name) DO NOTHING
+	""",
+	"""
+	INSERT INTO neighborhood (name, borough)
+	SELECT DISTINCT community_board, borough FROM staging_311 WHERE community_board IS NOT NULL
+	ON CONFLICT (name, borough) DO NOTHING
+	""",
+	"""
+	INSERT INTO address (street_address, zip, neighborhood_id, latitude, longitude)
+	SELECT DISTINCT ON (s.incident_address, s.incident_zip)
+		s.incident_address, s.incident_zip, n.neighborhood_id, s.latitude, s.longitude
+	FROM staging_311 s
+	LEFT JOIN neighborhood n ON n.name = s.community_board AND n.borough = s.borough
+	WHERE s.incident_address IS NOT NULL
+	ORDER BY s.incident_address, s.incident_zip
+	ON CONFLICT (street_address, zip) DO NOTHING
+	""",
+	# the closed days this batch touches, before and after, for rollup.refresh()
+	"""
+	INSERT INTO rollup_dirty_day (day)
+	SELECT c.closed_date::date FROM complaint c
+	JOIN staging_311 s ON s.unique_key = c.complaint_id AND s.created_date = c.created_date
+	WHERE c.closed_date IS NOT NULL
+	UNION
+	SELECT closed_date::date FROM staging_311 WHERE closed_date IS NOT NULL
+	ON CONFLICT (day) DO NOTHING
+	""",
+	"""
+	INSERT INTO complaint (complaint_id, created_date, closed_date, agency_id, complaint_type_id,
+		address_id, neighborhood_id, status_id, descriptor, resolution_description)
+	SELECT DISTINCT ON (s.unique_key)
+		s.unique_key, s.created_date, s.closed_date, a.agency_id, t.complaint_type_id,
+		ad.address_id, n.neighborhood_id, st.status_id, s.descriptor, s.resolution_description
+	FROM staging_311 s
+	JOIN agency a ON a.acronym = s.agency
+	JOIN complaint_type t ON t.name = s.complaint_type
+	LEFT JOIN address ad ON ad.street_address = s.incident_address AND ad.zip = s.incident_zip
+	LEFT JOIN neighborhood n ON n.name = s.community_board AND n.borough = s.borough
+	LEFT JOIN status st ON st.name = s.status
+	ORDER BY s.unique_key
+	ON CONFLICT (complaint_id, created_date) DO UPDATE SET
+		closed_date = EXCLUDED.closed_date,
+		neighborhood_id = coalesce(EXCLUDED.neighborhood_id, complaint.neighborhood_id),
+		status_id = EXCLUDED.status_id,
+		resolution_description = EXCLUDED.resolution_description
+	""",
+	# drop cached query results that read these tables, in every server process (see cache.py)
+	"""
+	SELECT pg_notify('query_cache', t)
+	FROM unnest(ARRAY['agency', 'complaint_type', 'status', 'neighborhood', 'address', 'complaint']) t
+	""",
+]
+
+TIMESTAMP_FORMATS = ["%m/%d/%Y %I:%M:%S %p", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y"]
+
+
+def parse_timestamp(value):
+	value = clean(value)
+	if value is None:
+		return None
+	try:
+		# SODA API: 2024-01-15T22:30:00.000
+		return datetime.fromisoformat(value)
+	except ValueError:
+		pass
+	for fmt in TIMESTAMP_FORMATS:
+		try:
+			return datetime.strptime(value, fmt)
+		except ValueError:
+			pass
+	return None
+
+
+def parse_float(value):
+	value = clean(value)
+	try:
+		return float(value) if value is not None else None
+	except ValueError:
+		return None
+
+
+def clean(value):
+	"""
+	Strips a raw field and turns empty strings into None.
+	"""
+	if value is None:
+		return None
+	value = str(value).strip()
+	return value or None
+
+
+def normalize_key(key):
+	# "Unique Key" (CSV) and unique_key (JSON) both become unique_key
+	return key.strip().lower().replace(" ", "_")
+
+
+def to_staging_row(record):
+	"""
+	Converts one raw record into a tuple in STAGING_COLUMNS order, or returns
+	None when it lacks the fields every complaint needs.
+	"""
+	r = {normalize_key(k): v for k, v in record.items() if k is not None}
+	try:
+		unique_key = int(clean(r.get("unique_key")))
+	except (TypeError, ValueError):
+		return None
+	created_date = parse_timestamp(r.get("created_date"))
+	agency = clean(r.get("agency"))
+	complaint_type = clean(r.get("complaint_type"))
+	if created_date is None or agency is None or complaint_type is None:
+		return None
+	return (
+		unique_key,
+		created_date,
+		parse_timestamp(r.get("closed_date")),
+		agency,
+		clean(r.get("agency_name")),
+		complaint_type,
+		clean(r.get("descriptor")),
+		clean(r.get("status")),
+		clean(r.get("resolution_description")),
+		clean(r.get("incident_address")),
+		clean(r.get("incident_zip")) or "",
+		clean(r.get("borough")) or "Unspecified",
+		clean(r.get("community_board")),
+		parse_float(r.get("latitude")),
+		parse_float(r.get("longitude")),
+	)
+
+
+def iter_csv_records(f):
+	yield from csv.DictReader(f)
+
+
+def iter_json_records(f, chunk_size=1 << 16):
+	"""
+	Yields the objects of a JSON array (or of newline-delimited JSON) without
+	reading the whole file, by decoding one value at a time out of a buffer.
+	"""
+	decoder = json.JSONDecoder()
+	buf = ""
+	in_array = None
+	while True:
+		buf = buf.lstrip()
+		if not buf:
+			more = f.read(chunk_size)
+			if not more:
+				return
+			buf = more
+			continue
+		if in_array is None:
+			in_array = buf.startswith("[")
+			if in_array:
+				buf = buf[1:]
+			continue
+		if in_array and buf.startswith(","):
+			buf = buf[1:]
+			continue
+		if in_array and buf.startswith("]"):
+			return
+		try:
+			obj, end = decoder.raw_decode(buf)
+		except json.JSONDecodeError:
+			more = f.read(chunk_size)
+			if not more:
+				raise
+			buf += more
+			continue
+		yield obj
+		buf = buf[end:]
+
+
+def iter_records(path, fmt=None):
+	if fmt is None:
+		fmt = "json" if path.lower().endswith((".json", ".ndjson", ".jsonl")) else "csv"
+	with open(path, newline='', encoding='utf-8') as f:
+		if fmt == "json":
+			yield from iter_json_records(f)
+		else:
+			yield from iter_csv_records(f)
+
+
+def latest_created_date(conn):
+	return conn.execute("SELECT max(created_date) FROM complaint").fetchone()[0]
+
+
+def load_batch(conn, source, rows, records_read):
+	"""
+	COPYs one batch into staging, normalizes it and saves the checkpoint, all in one transaction.
+	"""
+	with conn.transaction():
+		with conn.cursor() as cur:
+			with cur.copy("COPY staging_311 (%s) FROM STDIN" % ", ".join(STAGING_COLUMNS)) as copy:
+				for row in rows:
+					copy.write_row(row)
+			for statement in NORMALIZE:
+				cur.execute(statement)
+			cur.execute(
+				"UPDATE import_checkpoint SET records_read = %s, updated_at = now() WHERE source = %s",
+				(records_read, source),
+			)
+
+
+def import_file(uri, path, fmt=None, batch_size=50000, since=None, new_only=False, restart=False):
+	"""
+	Streams the export at path into the database at uri.
+
+	since (or, with new_only, the newest created_date already loaded) limits
+	the import to complaints created at or after that time. Complaints that
+	were closed at or after it are loaded too, so a daily refresh also picks
+	up closures of older complaints. Rows stamped exactly at since are loaded
+	again, since later ones can share that time (many carry only a date) and
+	loading a complaint twice just updates it.
+
+	A resumed import keeps the since it started with, whatever is passed now:
+	the records it skips were filtered with that since, and with new_only the
+	newest complaint loaded may already come from this file.
+	Returns (records read, complaints loaded).
+	"""
+	source = os.path.abspath(path)
+	stat = os.stat(source)
+	# autocommit, so each load_batch() below is its own transaction and its checkpoint sticks
+	with psycopg.connect(migrate.conninfo(uri), autocommit=True) as conn:
+		migrate.require_current(conn)
+		conn.execute(CREATE_STAGING)
+
+		skip = 0
+		row = None
+		if not restart:
+			row = conn.execute(
+				"SELECT records_read, file_size, file_mtime_ns, since FROM import_checkpoint WHERE source = %s",
+				(source,),
+			).fetchone()
+		if row is not None and row[1:3] == (stat.st_size, stat.st_mtime_ns):
+			skip, since = row[0], row[3]
+			print("resuming %s after %d records" % (path, skip))
+		else:
+			if row is not None:
+				print("%s has changed since its checkpoint was saved, reading it from the start" % path)
+			if new_only and since is None:
+				since = latest_created_date(conn)
+			conn.execute(
+				"""
+				INSERT INTO import_checkpoint (source, records_read, file_size, file_mtime_ns, since)
+				VALUES (%s, 0, %s, %s, %s)
+				ON CONFLICT (source) DO UPDATE SET records_read = 0, file_size = EXCLUDED.file_size,
+					file_mtime_ns = EXCLUDED.file_mtime_ns, since = EXCLUDED.since, updated_at = now()
+				""",
+				(source, stat.st_size, stat.st_mtime_ns, since),
+			)
+		if since is not None:
+			print("loading complaints created or closed at or after %s" % since)
+
+		records_read = 0
+		loaded = 0
+		batch = []
+		for record in iter_records(path, fmt):
+			records_read += 1
+			if records_read <= skip:
+				continue
+			row = to_staging_row(record)
+			if row is None:
+				continue
+			if since is not None and row[1] < since and (row[2] is None or row[2] < since):
+				continue
+			batch.append(row)
+			if len(batch) >= batch_size:
+				load_batch(conn, source, batch, records_read)
+				loaded += len(batch)
+				batch = []
+				print("%d records read, %d complaints loaded" % (records_read, loaded))
+
+		if batch:
+			load_batch(conn, source, batch, records_read)
+			loaded += len(batch)
+		conn.execute("DELETE FROM import_checkpoint WHERE source = %s", (source,))
+		print("done: %d records read, %d complaints loaded" % (records_read, loaded))
+		return records_read, loaded
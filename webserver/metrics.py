@@ -0,0 +1,146 @@
+"""
+Tiny in-process metrics registry for the webserver.
+
+Metrics register themselves when they are created and server.py renders all
+of them on the /metrics route in the Prometheus text format:
+
+    # HELP db_pool_checkouts_total Connections checked out of the pool by requests.
+    # TYPE db_pool_checkouts_total counter
+    db_pool_checkouts_total 42.0
+
+Values live in the memory of the process that serves the request, so with
+several gunicorn workers each scrape sees one worker; scrape them separately
+or add up what you get.
+"""
+import bisect
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+class Counter:
+	"""
+	A value that only goes up, e.g. number of checkouts or seconds spent waiting.
+	"""
+	kind = "counter"
+
+	def __init__(self, name, help_text):
+		self.name = name
+		self.help_text = help_text
+		self._value = 0.0
+		self._lock = threading.Lock()
+		register(self)
+
+	def inc(self, amount=1):
+		with self._lock:
+			self._value += amount
+
+	@property
+	def value(self):
+		return self._value
+
+	def samples(self):
+		yield self.name, {}, self._value
+
+
+class Gauge:
+	"""
+	A value read on demand from a function, e.g. connections currently checked out.
+	"""
+	kind = "gauge"
+
+	def __init__(self, name, help_text, read):
+		self.name = name
+		self.help_text = help_text
+		self.read = read
+		register(self)
+
+	@property
+	def value(self):
+		return float(self.read())
+
+	def samples(self):
+		yield self.name, {}, self.value
+
+
+class Histogram:
+	"""
+	Counts observations (e.g. request durations in seconds) in buckets, per
+	combination of label values:
+
+		REQUEST_SECONDS.observe(0.012, route="/stats", method="GET")
+	"""
+	kind = "histogram"
+
+	DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+	def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+		self.name = name
+		self.help_text = help_text
+		self.labelnames = tuple(labelnames)
+		self.buckets = tuple(sorted(buckets))
+		self._series = {}  # label values -> [count per bucket (last is +Inf), sum]
+		self._lock = threading.Lock()
+		register(self)
+
+	def observe(self, value, **labels):
+		key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+		index = bisect.bisect_left(self.buckets, value)
+		with self._lock:
+			series = self._series.get(key)
+			if series is None:
+				series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+			series[0][index] += 1
+			series[1] += value
+
+	def samples(self):
+		with self._lock:
+			series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+		for key, counts, total in sorted(series):
+			labels = dict(zip(self.labelnames, key))
+			cumulative = 0
+			for bound, count in zip(self.buckets + (float("inf"),), counts):
+				cumulative += count
+				le = "+Inf" if bound == float("inf") else repr(bound)
+				yield self.name + "_bucket", dict(labels, le=le), cumulative
+			yield self.name + "_sum", labels, total
+			yield self.name + "_count", labels, cumulative
+
+
+def register(metric):
+	"""
+	Adds metric to the registry, replacing one of the same name. That happens
+	when server.py is both run as __main__ and imported as server, as it is by
+	"python server.py serve"; the copy imported last is the one serving.
+	"""
+	with _registry_lock:
+		_registry[:] = [m for m in _registry if m.name != metric.name]
+		_registry.append(metric)
+
+
+def format_labels(labels):
+	if not labels:
+		return ""
+	pairs = []
+	for key, value in sorted(labels.items()):
+		value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+		pairs.append('%s="%s"' % (key, value))
+	return "{" + ",".join(pairs) + "}"
+
+
+def render():
+	"""
+	Returns every registered metric in the Prometheus text exposition format.
+	"""
+	with _registry_lock:
+		metrics = list(_registry)
+	lines = []
+	for metric in metrics:
+		lines.append("# HELP %s %s" % (metric.name, metric.help_text))
+		lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+		for name, labels, value in metric.samples():
+			lines.append("%s%s %s" % (name, format_labels(labels), repr(float(value))))
+	return "\n".join(lines) + "\n"
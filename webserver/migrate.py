@@ -0,0 +1,108 @@
+"""
+Versioned schema migrations.
+
+The schema lives in numbered SQL files in migrations/, e.g.
+
+    migrations/0001_initial_schema.sql
+    migrations/0002_seed_test.sql
+
+Each file is applied once, in order, in its own transaction, and recorded in
+the schema_migrations table. Apply the pending ones with
+
+    python server.py migrate
+
+and list what has been applied with "python server.py migrate --status". To
+change the schema, add a new file with the next number; never edit one that
+has already been applied somewhere.
+"""
+import os
+import re
+
+import psycopg
+from sqlalchemy.engine import make_url
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+CREATE_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+	version int PRIMARY KEY,
+	name text NOT NULL,
+	applied_at timestamptz NOT NULL DEFAULT now()
+)
+"""
+
+
+def conninfo(uri):
+	"""
+	Turns a SQLAlchemy URI (possibly postgresql+psycopg://...) into one psycopg accepts.
+	"""
+	return make_url(uri).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def available():
+	"""
+	Returns [(version, name, path), ...] for the files in migrations/, sorted by version.
+	"""
+	found = []
+	for filename in os.listdir(MIGRATIONS_DIR):
+		match = re.match(r"^(\d+)_(\w+)\.sql$", filename)
+		if match:
+			found.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+	found.sort()
+	return found
+
+
+def applied(conn):
+	"""
+	Returns {version: applied_at} for the migrations already applied to conn's database.
+	"""
+	exists = conn.execute("SELECT to_regclass('schema_migrations') IS NOT NULL").fetchone()[0]
+	if not exists:
+		return {}
+	return dict(conn.execute("SELECT version, applied_at FROM schema_migrations").fetchall())
+
+
+def pending(conn):
+	done = applied(conn)
+	return [m for m in available() if m[0] not in done]
+
+
+def require_current(conn):
+	"""
+	Raises RuntimeError unless every migration has been applied.
+	"""
+	missing = pending(conn)
+	if missing:
+		raise RuntimeError("the database schema is out of date (%d pending migrations), run: python server.py migrate" % len(missing))
+
+
+def migrate(uri):
+	"""
+	Applies the pending migrations to the database at uri. Returns the ones applied.
+	"""
+	done = []
+	with psycopg.connect(conninfo(uri), autocommit=True) as conn:
+		conn.execute(CREATE_MIGRATIONS_TABLE)
+		# keep two deploys from migrating at the same time
+		conn.execute("SELECT pg_advisory_lock(hashtext('migrate'))")
+		try:
+			for version, name, path in pending(conn):
+				with open(path) as f:
+					sql = f.read()
+				print("applying %04d_%s" % (version, name))
+				with conn.transaction():
+					conn.execute(sql)
+					conn.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+				done.append((version, name))
+		finally:
+			conn.execute("SELECT pg_advisory_unlock(hashtext('migrate'))")
+	return done
+
+
+def status(uri):
+	"""
+	Returns [(version, name, applied_at or None), ...] for every migration file.
+	"""
+	with psycopg.connect(conninfo(uri)) as conn:
+		done = applied(conn)
+	return [(version, name, done.get(version)) for version, name, _ in available()]
@@ -0,0 +1,115 @@
+--
+-- DDL for the 311 complaint data model (see "Databases project.md"), as it was
+-- before migrations existed. It uses IF NOT EXISTS throughout so that databases
+-- set up by the old schema.sql / import-time DDL can adopt migrations as well.
+--
+-- Entity sets: agency, complaint type, status, neighborhood, address, complaint.
+-- Neighborhoods come from the "Community Board" column of the 311 dataset
+-- (e.g. '12 MANHATTAN'), which is the closest thing it has to a neighborhood.
+--
+
+-- the example table from the class template
+CREATE TABLE IF NOT EXISTS test (
+	id serial,
+	name text
+);
+
+CREATE TABLE IF NOT EXISTS agency (
+	agency_id serial PRIMARY KEY,
+	acronym text NOT NULL UNIQUE,
+	name text
+);
+
+CREATE TABLE IF NOT EXISTS complaint_type (
+	complaint_type_id serial PRIMARY KEY,
+	name text NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS status (
+	status_id serial PRIMARY KEY,
+	name text NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS neighborhood (
+	neighborhood_id serial PRIMARY KEY,
+	name text NOT NULL,
+	borough text NOT NULL,
+	UNIQUE (name, borough)
+);
+
+CREATE TABLE IF NOT EXISTS address (
+	address_id serial PRIMARY KEY,
+	street_address text NOT NULL,
+	zip text NOT NULL,
+	neighborhood_id int REFERENCES neighborhood,
+	latitude double precision,
+	longitude double precision,
+	UNIQUE (street_address, zip)
+);
+
+-- complaint_id is the "Unique Key" of the 311 dataset
+CREATE TABLE IF NOT EXISTS complaint (
+	complaint_id bigint PRIMARY KEY,
+	created_date timestamp NOT NULL,
+	closed_date timestamp,
+	agency_id int NOT NULL REFERENCES agency,
+	complaint_type_id int NOT NULL REFERENCES complaint_type,
+	address_id int REFERENCES address,
+	status_id int REFERENCES status,
+	descriptor text,
+	resolution_description text
+);
+
+-- how far the bulk importer got through each source file, so it can resume
+CREATE TABLE IF NOT EXISTS import_checkpoint (
+	source text PRIMARY KEY,
+	records_read bigint NOT NULL,
+	updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+-- finding complaints by the day they were closed, for the rollup refresh
+CREATE INDEX IF NOT EXISTS complaint_closed_date_idx ON complaint (closed_date);
+
+--
+-- Resolution-time rollups, maintained by rollup.py. Resolution times are
+-- counted in log-scale buckets (see rollup.py) so that percentiles can be
+-- computed from pre-aggregated rows. neighborhood_id 0 means "unknown".
+--
+
+-- one row per closed day, agency, neighborhood, complaint type and bucket
+CREATE TABLE IF NOT EXISTS resolution_daily (
+	day date NOT NULL,
+	agency_id int NOT NULL,
+	neighborhood_id int NOT NULL,
+	complaint_type_id int NOT NULL,
+	bucket smallint NOT NULL,
+	closed_count int NOT NULL,
+	total_hours double precision NOT NULL,
+	PRIMARY KEY (day, agency_id, neighborhood_id, complaint_type_id, bucket)
+);
+
+-- resolution_daily summed over all days; this is what the web routes read
+CREATE TABLE IF NOT EXISTS resolution_summary (
+	agency_id int NOT NULL,
+	neighborhood_id int NOT NULL,
+	complaint_type_id int NOT NULL,
+	bucket smallint NOT NULL,
+	closed_count bigint NOT NULL,
+	total_hours double precision NOT NULL,
+	PRIMARY KEY (agency_id, neighborhood_id, complaint_type_id, bucket)
+);
+CREATE INDEX IF NOT EXISTS resolution_summary_neighborhood_idx ON resolution_summary (neighborhood_id);
+CREATE INDEX IF NOT EXISTS resolution_summary_complaint_type_idx ON resolution_summary (complaint_type_id);
+
+-- closed days whose rollup rows are out of date, filled in by the importer
+CREATE TABLE IF NOT EXISTS rollup_dirty_day (
+	day date PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS rollup_state (
+	name text PRIMARY KEY,
+	refreshed_at timestamptz NOT NULL
+);
+
+-- newest-first complaint listings with keyset pagination (complaints.py)
+CREATE INDEX IF NOT EXISTS complaint_created_date_idx ON complaint (created_date, complaint_id);
@@ -0,0 +1,7 @@
+--
+-- The example rows server.py used to insert into test on every start. They are
+-- now added once, and only if the table is still empty.
+--
+INSERT INTO test (name)
+SELECT name FROM (VALUES ('grace hopper'), ('alan turing'), ('ada lovelace')) AS seed (name)
+WHERE NOT EXISTS (SELECT 1 FROM test);
@@ -0,0 +1,63 @@
+--
+-- Rebuilds complaint as a table range-partitioned by created_date, one
+-- partition per year, and adds the indexes the web routes need:
+--
+--   (agency_id, created_date)        complaints of an agency over time
+--   (neighborhood_id, created_date)  complaints in a neighborhood over time
+--   (created_date, complaint_id)     newest-first listings (complaints.py)
+--   (closed_date)                    rollup refresh by closed day (rollup.py)
+--   open complaints only             a partial index on complaints not closed yet
+--
+-- To index complaints by neighborhood, neighborhood_id is copied from the
+-- address onto the complaint. Postgres requires the partition key in the
+-- primary key, so it becomes (complaint_id, created_date).
+--
+-- Years outside 2010-2035 land in complaint_default; split them out with
+-- ALTER TABLE ... DETACH/ATTACH PARTITION if that ever grows large.
+--
+
+ALTER TABLE complaint RENAME TO complaint_unpartitioned;
+ALTER TABLE complaint_unpartitioned RENAME CONSTRAINT complaint_pkey TO complaint_unpartitioned_pkey;
+DROP INDEX IF EXISTS complaint_closed_date_idx;
+DROP INDEX IF EXISTS complaint_created_date_idx;
+
+CREATE TABLE complaint (
+	complaint_id bigint NOT NULL,
+	created_date timestamp NOT NULL,
+	closed_date timestamp,
+	agency_id int NOT NULL REFERENCES agency,
+	complaint_type_id int NOT NULL REFERENCES complaint_type,
+	address_id int REFERENCES address,
+	neighborhood_id int REFERENCES neighborhood,
+	status_id int REFERENCES status,
+	descriptor text,
+	resolution_description text,
+	PRIMARY KEY (complaint_id, created_date)
+) PARTITION BY RANGE (created_date);
+
+DO $$
+BEGIN
+	FOR year IN 2010..2035 LOOP
+		EXECUTE format(
+			'CREATE TABLE complaint_%s PARTITION OF complaint FOR VALUES FROM (%L) TO (%L)',
+			year, make_date(year, 1, 1), make_date(year + 1, 1, 1));
+	END LOOP;
+END $$;
+CREATE TABLE complaint_default PARTITION OF complaint DEFAULT;
+
+CREATE INDEX complaint_agency_created_idx ON complaint (agency_id, created_date);
+CREATE INDEX complaint_neighborhood_created_idx ON complaint (neighborhood_id, created_date);
+CREATE INDEX complaint_created_date_idx ON complaint (created_date, complaint_id);
+CREATE INDEX complaint_closed_date_idx ON complaint (closed_date);
+CREATE INDEX complaint_open_idx ON complaint (agency_id, created_date) WHERE closed_date IS NULL;
+
+INSERT INTO complaint (complaint_id, created_date, closed_date, agency_id, complaint_type_id,
+	address_id, neighborhood_id, status_id, descriptor, resolution_description)
+SELECT c.complaint_id, c.created_date, c.closed_date, c.agency_id, c.complaint_type_id,
+	c.address_id, ad.neighborhood_id, c.status_id, c.descriptor, c.resolution_description
+FROM complaint_unpartitioned c
+LEFT JOIN address ad ON ad.address_id = c.address_id;
+
+DROP TABLE complaint_unpartitioned;
+
+ANALYZE complaint;
@@ -0,0 +1,12 @@
+--
+-- Records which file an import checkpoint belongs to and the since the import
+-- started with, so a resumed import filters the rest of the file the same way
+-- and a different file downloaded to the same path starts from the beginning.
+-- Checkpoints saved before this migration have no file identity and are
+-- treated as belonging to a different file.
+--
+
+ALTER TABLE import_checkpoint
+	ADD COLUMN file_size bigint,
+	ADD COLUMN file_mtime_ns bigint,
+	ADD COLUMN since timestamp;
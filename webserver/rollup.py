@@ -0,0 +1,237 @@
+"""
+Precomputed resolution-time statistics for the stats pages.
+
+Computing average and percentile time-to-close with a GROUP BY over the whole
+complaint table on every page view does not scale, so two rollup tables are
+kept instead (DDL in migrations/):
+
+    resolution_daily     counts per closed day, agency, neighborhood,
+                         complaint type and resolution-time bucket
+    resolution_summary   the same summed over all days
+
+The importer records every closed day it touches in rollup_dirty_day.
+refresh() recomputes resolution_daily for just those days and applies the
+difference to resolution_summary, so the cost of a refresh depends on how
+much changed, not on the size of the complaint table. Run it with
+
+    python server.py refresh-rollups
+
+(the import command does this for you). Web routes only read
+resolution_summary through resolution_stats().
+
+Resolution times go into log-scale buckets: bucket b holds complaints closed
+within 2^(b/2) / 4 hours, from 15 minutes (bucket 0) up to about 30 years
+(bucket 40). Percentiles are reported as the upper edge of the bucket they
+fall in, so they are accurate to within a factor of sqrt(2).
+"""
+import math
+
+from sqlalchemy import text
+
+MAX_BUCKET = 40
+
+BUCKET_SQL = "least(%d, greatest(0, ceil(2 * ln(greatest(h.hours * 4, 1)) / ln(2))))::smallint" % MAX_BUCKET
+
+REFRESH = [
+	# only one refresh at a time, or two of them could apply the same delta twice;
+	# import batches hold it shared (see importer.NORMALIZE) until they commit
+	"SELECT pg_advisory_xact_lock(hashtext('rollup.refresh'))",
+	"CREATE TEMP TABLE refresh_days (day date PRIMARY KEY) ON COMMIT DROP",
+	"WITH d AS (DELETE FROM rollup_dirty_day RETURNING day) INSERT INTO refresh_days SELECT DISTINCT day FROM d",
+	# take the old rows of those days out of the summary...
+	"""
+	INSERT INTO resolution_summary AS s (agency_id, neighborhood_id, complaint_type_id, bucket, closed_count, total_hours)
+	SELECT agency_id, neighborhood_id, complaint_type_id, bucket, -sum(closed_count), -sum(total_hours)
+	FROM resolution_daily WHERE day IN (SELECT day FROM refresh_days)
+	GROUP BY agency_id, neighborhood_id, complaint_type_id, bucket
+	ON CONFLICT (agency_id, neighborhood_id, complaint_type_id, bucket) DO UPDATE SET
+		closed_count = s.closed_count + EXCLUDED.closed_count,
+		total_hours = s.total_hours + EXCLUDED.total_hours
+	""",
+	"DELETE FROM resolution_daily WHERE day IN (SELECT day FROM refresh_days)",
+	# ...recompute them from the complaints closed on those days...
+	"""
+	INSERT INTO resolution_daily (day, agency_id, neighborhood_id, complaint_type_id, bucket, closed_count, total_hours)
+	SELECT d.day, c.agency_id, coalesce(c.neighborhood_id, 0), c.complaint_type_id, %s, count(*), sum(h.hours)
+	FROM refresh_days d
+	JOIN complaint c ON c.closed_date >= d.day AND c.closed_date < d.day + 1
+	CROSS JOIN LATERAL (SELECT extract(epoch FROM c.closed_date - c.created_date) / 3600.0 AS hours) h
+	WHERE c.closed_date >= c.created_date
+	GROUP BY 1, 2, 3, 4, 5
+	""" % BUCKET_SQL,
+	# ...and add the new ones back in
+	"""
+	INSERT INTO resolution_summary AS s (agency_id, neighborhood_id, complaint_type_id, bucket, closed_count, total_hours)
+	SELECT agency_id, neighborhood_id, complaint_type_id, bucket, sum(closed_count), sum(total_hours)
+	FROM resolution_daily WHERE day IN (SELECT day FROM refresh_days)
+	GROUP BY agency_id, neighborhood_id, complaint_type_id, bucket
+	ON CONFLICT (agency_id, neighborhood_id, complaint_type_id, bucket) DO UPDATE SET
+		closed_count = s.closed_count + EXCLUDED.closed_count,
+		total_hours = s.total_hours + EXCLUDED.total_hours
+	""",
+	"DELETE FROM resolution_summary WHERE closed_count = 0",
+	"SELECT pg_notify('query_cache', 'resolution_summary')",
+	"""
+	INSERT INTO rollup_state (name, refreshed_at) VALUES ('resolution', now())
+	ON CONFLICT (name) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at
+	""",
+]
+
+MARK_ALL_DIRTY = """
+INSERT INTO rollup_dirty_day (day)
+SELECT DISTINCT closed_date::date FROM complaint WHERE closed_date IS NOT NULL
+ON CONFLICT (day) DO NOTHING
+"""
+
+# what the stats can be grouped and filtered by: (label column, join)
+GROUPS = {
+	"agency": ("a.acronym", "JOIN agency a ON a.agency_id = r.agency_id"),
+	"neighborhood": ("n.name", "JOIN neighborhood n ON n.neighborhood_id = r.neighborhood_id"),
+	"complaint_type": ("t.name", "JOIN complaint_type t ON t.complaint_type_id = r.complaint_type_id"),
+}
+
+
+def refresh(conn, full=False):
+	"""
+	Brings the rollup tables up to date with the complaint table. With full,
+	every closed day is recomputed (e.g. after loading data without the importer).
+	Commits and returns the number of days refreshed.
+	"""
+	if full:
+		conn.execute(text(MARK_ALL_DIRTY))
+	days = 0
+	for statement in REFRESH:
+		result = conn.execute(text(statement))
+		if statement.startswith("WITH d AS"):
+			days = result.rowcount
+	conn.commit()
+	return days
+
+
+def bucket_upper_hours(bucket):
+	return 2 ** (bucket / 2.0) / 4
+
+
+def percentile_hours(bucket_counts, total, pct):
+	"""
+	Upper edge of the bucket the pct-th percentile falls in, from (bucket, count) pairs sorted by bucket.
+	"""
+	rank = math.ceil(total * pct / 100.0)
+	seen = 0
+	for bucket, count in bucket_counts:
+		seen += count
+		if seen >= rank:
+			return bucket_upper_hours(bucket)
+	return None
+
+
+# tables resolution_stats() reads, for cache invalidation
+TABLES = ("resolution_summary", "agency", "neighborhood", "complaint_type")
+
+
+def stats_query(group_by, agency=None, neighborhood=None, complaint_type=None):
+	"""
+	Builds the query behind resolution_stats(). Returns (query, params).
+	"""
+	label, _ = GROUPS[group_by]
+	joins = []
+	where = []
+	params = {}
+	for name, value in (("agency", agency), ("neighborhood", neighborhood), ("complaint_type", complaint_type)):
+		if name == group_by or value is not None:
+			joins.append(GROUPS[name][1])
+		if value is not None:
+			where.append("%s = :%s" % (GROUPS[name][0], name))
+			params[name] = value
+	query = """
+	SELECT %s AS label, r.bucket, sum(r.closed_count)::bigint AS closed_count, sum(r.total_hours) AS total_hours
+	FROM resolution_summary r %s
+	%s
+	GROUP BY 1, 2
+	ORDER BY 1, 2
+	""" % (label, " ".join(joins), ("WHERE " + " AND ".join(where)) if where else "")
+	return query, params
+
+
+def resolution_stats(conn, group_by, agency=None, neighborhood=None, complaint_type=None):
+	"""
+	Average and percentile time-to-close, in hours, per agency, neighborhood or
+	complaint type, optionally limited to one agency/neighborhood/complaint type.
+	Returns a list of dicts sorted by label.
+	"""
+	query, params = stats_query(group_by, agency, neighborhood, complaint_type)
+	return run_stats_query(conn, query, params)
+
+
+def run_stats_query(conn, query, params):
+	return summarize(conn.execute(text(query), params))
+
+
+def summarize(rows):
+	"""
+	Turns (label, bucket, closed_count, total_hours) rows, sorted by label and
+	bucket, into one dict of statistics per label.
+	"""
+	stats = []
+	current = None
+	for row in rows:
+		if current is None or current["label"] != row.label:
+			current = {"label": row.label, "closed": 0, "total_hours": 0.0, "buckets": []}
+			stats.append(current)
+		current["closed"] += row.closed_count
+		current["total_hours"] += row.total_hours
+		current["buckets"].append((row.bucket, row.closed_count))
+
+	for s in stats:
+		buckets = s.pop("buckets")
+		s["mean_hours"] = s.pop("total_hours") / s["closed"]
+		s["p50_hours"] = percentile_hours(buckets, s["closed"], 50)
+		s["p90_hours"] = percentile_hours(buckets, s["closed"], 90)
+	return stats
+
+
+def batch_stats_query(agencies=(), neighborhoods=(), complaint_types=()):
+	"""
+	Builds one query that returns the overall statistics of each of the given
+	agencies, neighborhoods and complaint types, so a dashboard needs a single
+	round trip however many it shows. Returns (query, params).
+	"""
+	parts = []
+	params = {}
+	for group_by, names in (("agency", agencies), ("neighborhood", neighborhoods), ("complaint_type", complaint_types)):
+		if not names:
+			continue
+		label, join = GROUPS[group_by]
+		parts.append("""
+		SELECT '%s' AS kind, %s AS label, r.bucket, sum(r.closed_count)::bigint AS closed_count, sum(r.total_hours) AS total_hours
+		FROM resolution_summary r %s
+		WHERE %s = ANY(:%s)
+		GROUP BY 1, 2, 3
+		""" % (group_by, label, join, label, group_by))
+		params[group_by] = list(names)
+	if not parts:
+		return None, params
+	return " UNION ALL ".join(parts) + " ORDER BY 1, 2, 3", params
+
+
+def run_batch_stats_query(conn, query, params):
+	"""
+	Returns {group: [stats, ...]} for the query built by batch_stats_query().
+	"""
+	result = {}
+	if query is None:
+		return result
+	rows = conn.execute(text(query), params).all()
+	for group_by in GROUPS:
+		result[group_by] = summarize(row for row in rows if row.kind == group_by)
+	return result
+
+
+REFRESHED_AT_QUERY = "SELECT refreshed_at FROM rollup_state WHERE name = 'resolution'"
+
+
+def refreshed_at(conn):
+	"""
+	When refresh() last ran, or None if it never has.
+	"""
+	return conn.execute(text(REFRESHED_AT_QUERY)).scalar()
@@ -5,14 +5,26 @@ Example Webserver
 To run locally:
     python server.py
 Go to http://localhost:8111 in your browser.
+To run in production with several worker processes (needs gunicorn):
+    python server.py serve --workers 8
 A debugger such as "pdb" may be helpful for debugging.
 Read about it online.
 """
 import os
+import re
+import threading
+import time
 # accessible as a variable in index.html:
 from sqlalchemy import *
-from sqlalchemy.pool import NullPool
-from flask import Flask, request, render_template, g, redirect, Response, abort
+from sqlalchemy import exc, event
+from sqlalchemy.pool import NullPool, QueuePool
+from flask import Flask, request, render_template, stream_template, g, redirect, Response, abort, jsonify
+
+import cache
+import complaints
+import metrics
+import rollup
+from migrate import conninfo
 
 tmpl_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
 app = Flask(__name__, template_folder=tmpl_dir)
@@ -33,58 +45,261 @@ app = Flask(__name__, template_folder=tmpl_dir)
 DATABASE_USERNAME = ""
 DATABASE_PASSWRD = ""
 DATABASE_HOST = "34.139.8.30"
-DATABASEURI = f"postgresql://{DATABASE_USERNAME}:{DATABASE_PASSWRD}@{DATABASE_HOST}/proj1part2"
+DATABASEURI = os.environ.get("DATABASEURI", f"postgresql://{DATABASE_USERNAME}:{DATABASE_PASSWRD}@{DATABASE_HOST}/proj1part2")
+
+
+#
+# Connection pool settings. Every request used to open a brand new connection to
+# the remote Postgres host; with the "queue" mode connections are kept open and
+# handed out again to later requests instead. "null" keeps the old behaviour
+# (one fresh connection per checkout) and is mostly useful for benchmarking.
+#
+#   DATABASE_POOL_SIZE      connections kept open in the pool
+#   DATABASE_MAX_OVERFLOW   extra connections allowed during a burst
+#   DATABASE_POOL_TIMEOUT   seconds a request waits for a free connection
+#   DATABASE_POOL_RECYCLE   seconds after which a connection is replaced
+#   DATABASE_POOL_PRE_PING  test a connection with a SELECT 1 before reuse (on
+#                           by default). This catches connections dropped by an
+#                           idle timeout or a server restart, which the recycle
+#                           above can't; set it to 0 to save the round trip
+#                           when the database is close by and always up
+#
+DATABASE_POOL_MODE = os.environ.get("DATABASE_POOL_MODE", "queue")
+DATABASE_POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", 5))
+DATABASE_MAX_OVERFLOW = int(os.environ.get("DATABASE_MAX_OVERFLOW", 10))
+DATABASE_POOL_TIMEOUT = float(os.environ.get("DATABASE_POOL_TIMEOUT", 10))
+DATABASE_POOL_RECYCLE = int(os.environ.get("DATABASE_POOL_RECYCLE", 1800))
+DATABASE_POOL_PRE_PING = os.environ.get("DATABASE_POOL_PRE_PING", "1") == "1"
+
+POOL_CHECKOUTS = metrics.Counter("db_pool_checkouts_total", "Connections checked out of the pool by requests.")
+POOL_CHECKOUT_WAIT = metrics.Counter("db_pool_checkout_wait_seconds_total", "Time requests spent waiting for a pooled connection.")
+POOL_CHECKOUT_TIMEOUTS = metrics.Counter("db_pool_checkout_timeouts_total", "Checkouts that gave up after DATABASE_POOL_TIMEOUT.")
+POOL_CONNECTS = metrics.Counter("db_pool_connects_total", "New connections opened to the database server.")
+
+#
+# Timing of web requests and SQL statements, served on /metrics. Statements
+# slower than SLOW_QUERY_SECONDS are also written to the log with their
+# parameters (set it to 0 to log every statement).
+#
+SLOW_QUERY_SECONDS = float(os.environ.get("SLOW_QUERY_SECONDS", 0.5))
+
+REQUEST_SECONDS = metrics.Histogram("http_request_duration_seconds",
+	"Time to handle a request, up to the last byte for streamed responses.", ("route", "method", "status"))
+QUERY_SECONDS = metrics.Histogram("db_query_duration_seconds",
+	"Time to execute a SQL statement.", ("statement",))
+SLOW_QUERIES = metrics.Counter("db_slow_queries_total", "SQL statements slower than SLOW_QUERY_SECONDS.")
+
+
+def statement_label(statement):
+	"""
+	Collapses the whitespace of a SQL statement, to use as a metric label.
+
+	The statement is kept whole so that variants differing only in their WHERE
+	clause get their own series. Values are bound as parameters, so the routes'
+	query templates keep the number of distinct labels small.
+	"""
+	return re.sub(r"\s+", " ", statement).strip()
+
+
+def make_engine(uri=DATABASEURI, mode=DATABASE_POOL_MODE):
+	"""
+	Creates a database engine for the URI using the pool settings above.
+	"""
+	if mode == "null":
+		new_engine = create_engine(uri, poolclass=NullPool)
+	elif mode == "queue":
+		new_engine = create_engine(
+			uri,
+			poolclass=QueuePool,
+			pool_size=DATABASE_POOL_SIZE,
+			max_overflow=DATABASE_MAX_OVERFLOW,
+			pool_timeout=DATABASE_POOL_TIMEOUT,
+			pool_recycle=DATABASE_POOL_RECYCLE,
+			pool_pre_ping=DATABASE_POOL_PRE_PING,
+		)
+	else:
+		raise ValueError("unknown DATABASE_POOL_MODE %r, expected 'queue' or 'null'" % mode)
+
+	@event.listens_for(new_engine, "connect")
+	def count_connect(dbapi_connection, connection_record):
+		POOL_CONNECTS.inc()
+
+	@event.listens_for(new_engine, "before_cursor_execute")
+	def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+		# conn.info lives as long as the pooled connection; statements on it don't nest
+		conn.info["query_start"] = time.perf_counter()
+
+	@event.listens_for(new_engine, "handle_error")
+	def drop_query_timer(exception_context):
+		if exception_context.connection is not None:
+			exception_context.connection.info.pop("query_start", None)
+
+	@event.listens_for(new_engine, "after_cursor_execute")
+	def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+		elapsed = time.perf_counter() - conn.info.pop("query_start")
+		label = statement_label(statement)
+		QUERY_SECONDS.observe(elapsed, statement=label)
+		if elapsed >= SLOW_QUERY_SECONDS:
+			SLOW_QUERIES.inc()
+			app.logger.warning("slow query (%.3fs): %s %r", elapsed, label, parameters)
+
+	return new_engine
 
 
 #
 # This line creates a database engine that knows how to connect to the URI above.
 #
-engine = create_engine(DATABASEURI)
+engine = make_engine()
+
+
+def pool_status(name):
+	"""
+	Reads one of size/checkedout/overflow from the current engine's pool (0 for NullPool).
+	"""
+	read = getattr(engine.pool, name, None)
+	return read() if read is not None and isinstance(engine.pool, QueuePool) else 0
+
+metrics.Gauge("db_pool_size", "Connections the pool keeps open.", lambda: pool_status("size"))
+metrics.Gauge("db_pool_checked_out", "Pooled connections currently in use by requests.", lambda: pool_status("checkedout"))
+metrics.Gauge("db_pool_overflow", "Connections open beyond the pool size.", lambda: max(0, pool_status("overflow")))
 
 #
-# Example of running queries in your database
-# Note that this will probably not work if you already have a table named 'test' in your database, containing meaningful data. This is only an example showing you how to run queries in your database using SQLAlchemy.
+# Cache for the results of read queries (see cache.py). QUERY_CACHE_MAX_BYTES
+# bounds its memory use (0 turns it off) and QUERY_CACHE_TTLS says how many
+# seconds each route may serve a cached result for.
 #
-with engine.connect() as conn:
-	create_table_command = """
-	CREATE TABLE IF NOT EXISTS test (
-		id serial,
-		name text
-	)
+QUERY_CACHE_MAX_BYTES = int(os.environ.get("QUERY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+QUERY_CACHE_TTLS = {
+	"index": 30,
+	"stats": 600,
+	"api_stats": 600,
+	"api_stats_batch": 600,
+}
+query_cache = cache.QueryCache(QUERY_CACHE_MAX_BYTES)
+query_cache_listener = None
+query_cache_listener_lock = threading.Lock()
+
+metrics.Gauge("query_cache_entries", "Results currently held in the query cache.", lambda: len(query_cache))
+metrics.Gauge("query_cache_bytes", "Approximate size of the results in the query cache.", lambda: query_cache.bytes)
+metrics.Gauge("query_cache_max_bytes", "Memory budget of the query cache, 0 when it is off.", lambda: query_cache.max_bytes)
+
+
+def cached_query(query, params, compute, tables):
 	"""
-	res = conn.execute(text(create_table_command))
-	insert_table_command = """INSERT INTO test(name) VALUES ('grace hopper'), ('alan turing'), ('ada lovelace')"""
-	res = conn.execute(text(insert_table_command))
-	# you need to commit for create, insert, update queries to reflect
-	conn.commit()
+	Runs compute() through the query cache, using the TTL of the current route.
+	"""
+	ttl = QUERY_CACHE_TTLS.get(request.endpoint, 0)
+	return query_cache.fetch(query, params, compute, ttl, tables)
+
+
+#
+# The tables (including the example table 'test') are created by the numbered
+# SQL files in migrations/, not when this module is imported. Set up or update
+# the database with:
+#
+#     python server.py migrate
+#
+
+
+def init_worker():
+	"""
+	Gets a freshly forked worker process ready to serve (see wsgi.py).
+
+	Connections opened before the fork are shared with the parent process and
+	must not be used here, so they are dropped without closing them and the
+	worker builds its own engine and pool. The query cache listener thread
+	doesn't survive a fork either, so it is started again on the next request.
+	"""
+	global engine, query_cache_listener
+	engine.dispose(close=False)
+	engine = make_engine()
+	query_cache.clear()
+	query_cache_listener = None
 
 
 @app.before_request
-def before_request():
+def start_request_timer():
+	g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+	"""
+	Records how long the request took, labelled with the route pattern (like
+	/api/v1/stats) rather than the URL, so query strings don't make new series.
+
+	A streamed response (like /complaints) hasn't run its queries or rendered
+	anything yet at this point, so its time is recorded when the server closes
+	it after sending the last byte.
 	"""
-	This function is run at the beginning of every web request 
-	(every time you enter an address in the web browser).
-	We use it to setup a database connection that can be used throughout the request.
+	start = g.pop('request_start', None)
+	if start is not None:
+		route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+		labels = dict(route=route, method=request.method, status=response.status_code)
+		if response.is_streamed:
+			response.call_on_close(lambda: REQUEST_SECONDS.observe(time.perf_counter() - start, **labels))
+		else:
+			REQUEST_SECONDS.observe(time.perf_counter() - start, **labels)
+	return response
+
+
+@app.before_request
+def start_query_cache_listener():
+	"""
+	Starts the thread that drops cached results when other processes write to
+	the database. It is started on the first request rather than at import so
+	that it runs in the process actually serving requests. The lock keeps
+	concurrent first requests from each starting one (and each holding a
+	connection open for the life of the process).
+	"""
+	global query_cache_listener
+	if query_cache_listener is not None or QUERY_CACHE_MAX_BYTES <= 0:
+		return
+	with query_cache_listener_lock:
+		if query_cache_listener is None:
+			query_cache_listener = cache.listen(conninfo(DATABASEURI), query_cache)
+
+
+def get_db():
+	"""
+	Returns the database connection for the current web request.
+
+	The connection is only checked out of the pool the first time a route asks
+	for it, so routes that never touch the database (like /another) don't hold
+	one at all. It is stored on g so the rest of the request reuses it.
 
 	The variable g is globally accessible.
 	"""
-	try:
-		g.conn = engine.connect()
-	except:
-		print("uh oh, problem connecting to database")
-		import traceback; traceback.print_exc()
-		g.conn = None
+	if 'conn' not in g:
+		start = time.perf_counter()
+		try:
+			g.conn = engine.connect()
+		except exc.TimeoutError:
+			POOL_CHECKOUT_TIMEOUTS.inc()
+			raise
+		finally:
+			POOL_CHECKOUT_WAIT.inc(time.perf_counter() - start)
+		POOL_CHECKOUTS.inc()
+	return g.conn
+
+def detach_db():
+	"""
+	Like get_db(), but hands the connection over to the caller, who must close
+	it. Streamed responses need this: they keep reading rows after the route
+	has returned and teardown_request has already run.
+	"""
+	conn = get_db()
+	del g.conn
+	return conn
 
 @app.teardown_request
 def teardown_request(exception):
 	"""
-	At the end of the web request, this makes sure to close the database connection.
-	If you don't, the database could run out of memory!
+	At the end of the web request, this hands the database connection back to the pool.
+	If you don't, the pool runs dry and later requests wait for a free connection!
 	"""
-	try:
-		g.conn.close()
-	except Exception as e:
-		pass
+	conn = g.pop('conn', None)
+	if conn is not None:
+		conn.close()
 
 
 #
@@ -113,18 +328,22 @@ def index():
 	"""
 
 	# DEBUG: this is debugging code to see what request looks like
-	print(request.args)
+	# (shown when the server runs with --debug)
+	app.logger.debug("request args: %s", request.args)
 
 
 	#
 	# example of a database query
 	#
 	select_query = "SELECT name from test"
-	cursor = g.conn.execute(text(select_query))
-	names = []
-	for result in cursor:
-		names.append(result[0])
-	cursor.close()
+	def run_query():
+		cursor = get_db().execute(text(select_query))
+		names = []
+		for result in cursor:
+			names.append(result[0])
+		cursor.close()
+		return names
+	names = cached_query(select_query, {}, run_query, tables=("test",))
 
 	#
 	# Flask uses Jinja templates, which is an extension to HTML where you can
@@ -174,6 +393,142 @@ def another():
 	return render_template("another.html")
 
 
+#
+# Resolution-time statistics, e.g.
+#
+#     localhost:8111/stats?by=neighborhood&agency=NYPD
+#
+# by is one of agency, neighborhood or complaint_type. The numbers come from the
+# precomputed rollup tables (see rollup.py), not from the complaint table.
+#
+@app.route('/stats')
+def stats():
+	group_by = request.args.get('by', 'agency')
+	if group_by not in rollup.GROUPS:
+		abort(400)
+	filters = {}
+	for name in rollup.GROUPS:
+		filters[name] = request.args.get(name) or None
+	query, params = rollup.stats_query(group_by, **filters)
+	rows = cached_query(query, params, lambda: rollup.run_stats_query(get_db(), query, params), tables=rollup.TABLES)
+	return render_template("stats.html", rows=rows, by=group_by, groups=list(rollup.GROUPS), **filters)
+
+
+#
+# Complaint listing, newest first, e.g.
+#
+#     localhost:8111/complaints?neighborhood=12 MANHATTAN&limit=50
+#
+# Pages are chained with the after= cursor of the last row (see complaints.py),
+# and rows are streamed to the browser while they are read from the database.
+#
+@app.route('/complaints')
+def complaint_list():
+	filters = {}
+	for name in complaints.FILTERS:
+		filters[name] = request.args.get(name) or None
+	after = request.args.get('after') or None
+	limit = request.args.get('limit', complaints.DEFAULT_PAGE_SIZE, type=int)
+	if not 0 < limit <= complaints.MAX_PAGE_SIZE:
+		abort(400)
+	try:
+		# check the cursor now, so a bad one is a 400 and not a broken stream
+		complaints.listing_query(after, limit, **filters)
+	except ValueError:
+		abort(400)
+
+	def rows():
+		conn = detach_db()
+		try:
+			yield from complaints.stream_listing(conn, after=after, limit=limit, **filters)
+		finally:
+			conn.close()
+	return stream_template("complaints.html", rows=rows(), limit=limit, **filters)
+
+
+#
+# JSON API for the stats front end. Versioned under /api/v1 so the HTML pages
+# and the API can change independently.
+#
+#     localhost:8111/api/v1/stats?by=agency&neighborhood=12 MANHATTAN
+#     localhost:8111/api/v1/stats/batch?agency=NYPD&agency=DSNY&neighborhood=12 MANHATTAN
+#
+# The batch endpoint returns the stats of every agency, neighborhood and
+# complaint type asked for from a single query, so a dashboard needs one request
+# instead of one per entity. It also accepts a POST with a JSON body like
+# {"agency": [...], "neighborhood": [...], "complaint_type": [...]}.
+#
+# Responses carry an ETag and a Last-Modified (the last rollup refresh), so
+# clients and proxies can revalidate them and get an empty 304 back.
+#
+API_BATCH_LIMIT = 200
+API_MAX_AGE = 60
+
+
+def api_error(status, message):
+	response = jsonify(error=message)
+	response.status_code = status
+	return response
+
+
+def api_response(payload):
+	"""
+	Returns payload as JSON with caching headers, or a 304 if the client's copy is current.
+	"""
+	refreshed = cached_query(rollup.REFRESHED_AT_QUERY, {}, lambda: rollup.refreshed_at(get_db()), tables=("resolution_summary",))
+	payload["refreshed_at"] = refreshed.isoformat() if refreshed is not None else None
+	response = jsonify(payload)
+	response.add_etag()
+	response.last_modified = refreshed
+	response.cache_control.public = True
+	response.cache_control.max_age = API_MAX_AGE
+	return response.make_conditional(request)
+
+
+@app.route('/api/v1/stats')
+def api_stats():
+	group_by = request.args.get('by', 'agency')
+	if group_by not in rollup.GROUPS:
+		return api_error(400, "by must be one of %s" % ", ".join(rollup.GROUPS))
+	filters = {}
+	for name in rollup.GROUPS:
+		filters[name] = request.args.get(name) or None
+	query, params = rollup.stats_query(group_by, **filters)
+	rows = cached_query(query, params, lambda: rollup.run_stats_query(get_db(), query, params), tables=rollup.TABLES)
+	return api_response({"by": group_by, "filters": filters, "stats": rows})
+
+
+@app.route('/api/v1/stats/batch', methods=['GET', 'POST'])
+def api_stats_batch():
+	if request.method == 'POST':
+		body = request.get_json(silent=True)
+		if not isinstance(body, dict):
+			return api_error(400, "expected a JSON object")
+		names = {}
+		for group_by in rollup.GROUPS:
+			names[group_by] = body.get(group_by) or []
+			if not isinstance(names[group_by], list) or not all(isinstance(n, str) for n in names[group_by]):
+				return api_error(400, "%s must be a list of names" % group_by)
+	else:
+		names = {group_by: request.args.getlist(group_by) for group_by in rollup.GROUPS}
+	if sum(len(n) for n in names.values()) > API_BATCH_LIMIT:
+		return api_error(400, "at most %d names per request" % API_BATCH_LIMIT)
+
+	for group_by in names:
+		names[group_by] = sorted(set(names[group_by]))
+	query, params = rollup.batch_stats_query(names["agency"], names["neighborhood"], names["complaint_type"])
+	found = {}
+	if query is not None:
+		found = cached_query(query, params, lambda: rollup.run_batch_stats_query(get_db(), query, params), tables=rollup.TABLES)
+
+	# every name asked for is in the answer, with null if there are no stats for it
+	result = {}
+	for group_by, wanted in names.items():
+		by_label = {s["label"]: s for s in found.get(group_by, [])}
+		result[group_by] = {name: by_label.get(name) for name in wanted}
+	return api_response(result)
+
+
 # Example of adding new data to the database
 @app.route('/add', methods=['POST'])
 def add():
@@ -183,11 +538,26 @@ def add():
 	# passing params in for each variable into query
 	params = {}
 	params["new_name"] = name
-	g.conn.execute(text('INSERT INTO test(name) VALUES (:new_name)'), params)
-	g.conn.commit()
+	conn = get_db()
+	conn.execute(text('INSERT INTO test(name) VALUES (:new_name)'), params)
+	# tell the other server processes too, once the insert commits
+	conn.execute(text("SELECT pg_notify(:channel, 'test')"), {"channel": cache.CHANNEL})
+	conn.commit()
+	query_cache.invalidate("test")
 	return redirect('/')
 
 
+# Request and query latency histograms, slow query and connection pool
+# counters and query cache counters in the Prometheus text format, e.g. for
+# scraping or for a quick
+#
+#     curl localhost:8111/metrics
+#
+@app.route('/metrics')
+def metrics_page():
+	return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.route('/login')
 def login():
 	abort(401)
@@ -199,7 +569,17 @@ def login():
 if __name__ == "__main__":
 	import click
 
-	@click.command()
+	@click.group(invoke_without_command=True)
+	@click.pass_context
+	def cli(ctx):
+		"""
+		Command line entry point. Without a command it starts the web server,
+		so plain "python server.py" still works.
+		"""
+		if ctx.invoked_subcommand is None:
+			ctx.invoke(run)
+
+	@cli.command()
 	@click.option('--debug', is_flag=True)
 	@click.option('--threaded', is_flag=True)
 	@click.argument('HOST', default='0.0.0.0')
@@ -213,7 +593,7 @@ if __name__ == "__main__":
 
 		Show the help text using:
 
-			python server.py --help
+			python server.py run --help
 
 		"""
 
@@ -221,4 +601,79 @@ if __name__ == "__main__":
 		print("running on %s:%d" % (HOST, PORT))
 		app.run(host=HOST, port=PORT, debug=debug, threaded=threaded)
 
-run()
+	@cli.command()
+	@click.option('--workers', type=int, help='Worker processes (default: one per CPU).')
+	@click.option('--threads', default=4, help='Threads per worker.')
+	@click.option('--keepalive', default=5, help='Seconds to keep an idle HTTP connection open.')
+	@click.option('--timeout', default=30, help='Seconds before a stuck worker is restarted.')
+	@click.option('--graceful-timeout', default=30, help='Seconds old workers get to finish on reload or stop.')
+	@click.option('--max-requests', default=0, help='Restart a worker after this many requests (0: never).')
+	@click.option('--preload', is_flag=True, help='Import the app once in the master before forking.')
+	@click.option('--pid', 'pidfile', type=click.Path(dir_okay=False), help='Write the master pid to this file.')
+	@click.argument('HOST', default='0.0.0.0')
+	@click.argument('PORT', default=8111, type=int)
+	def serve(workers, threads, keepalive, timeout, graceful_timeout, max_requests, preload, pidfile, host, port):
+		"""
+		Run the server for production, with several worker processes:
+
+			python server.py serve --workers 8 0.0.0.0 8111
+
+		Needs gunicorn. Send SIGHUP to the master process to reload gracefully.
+		"""
+		import wsgi
+		if DATABASE_POOL_MODE == "queue" and DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW < threads:
+			print("warning: DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW is smaller than --threads, requests will wait for connections")
+		try:
+			wsgi.serve(host, port, workers=workers, threads=threads, keepalive=keepalive, timeout=timeout,
+				graceful_timeout=graceful_timeout, max_requests=max_requests, preload=preload, pidfile=pidfile)
+		except RuntimeError as e:
+			raise click.ClickException(str(e))
+
+	@cli.command('import')
+	@click.argument('PATH', type=click.Path(exists=True, dir_okay=False))
+	@click.option('--format', 'fmt', type=click.Choice(['csv', 'json']), help='Defaults to the file extension.')
+	@click.option('--batch-size', default=50000, help='Records per COPY batch.')
+	@click.option('--since', type=click.DateTime(), help='Only load complaints created or closed at or after this time.')
+	@click.option('--new-only', is_flag=True, help='Like --since, using the newest complaint already loaded.')
+	@click.option('--restart', is_flag=True, help='Ignore the checkpoint and read the file from the start.')
+	def import_311(path, fmt, batch_size, since, new_only, restart):
+		"""
+		Bulk load a 311 Service Requests export (CSV or JSON):
+
+			python server.py import 311_Service_Requests.csv
+
+		An interrupted import resumes from its last batch when run again.
+		"""
+		import importer
+		try:
+			importer.import_file(DATABASEURI, path, fmt=fmt, batch_size=batch_size,
+				since=since, new_only=new_only, restart=restart)
+		except RuntimeError as e:
+			raise click.ClickException(str(e))
+		with engine.connect() as conn:
+			print("refreshed rollups for %d days" % rollup.refresh(conn))
+
+	@cli.command('refresh-rollups')
+	@click.option('--full', is_flag=True, help='Recompute every day instead of only the changed ones.')
+	def refresh_rollups(full):
+		"""
+		Bring the resolution-time rollups up to date with the complaint table.
+		"""
+		with engine.connect() as conn:
+			print("refreshed rollups for %d days" % rollup.refresh(conn, full=full))
+
+	@cli.command('migrate')
+	@click.option('--status', 'show_status', is_flag=True, help='List the migrations instead of applying them.')
+	def migrate_db(show_status):
+		"""
+		Create or update the database schema from the files in migrations/.
+		"""
+		import migrate
+		if show_status:
+			for version, name, applied_at in migrate.status(DATABASEURI):
+				print("%04d_%-30s %s" % (version, name, applied_at or "pending"))
+			return
+		done = migrate.migrate(DATABASEURI)
+		print("applied %d migrations" % len(done))
+
+	cli()
@@ -0,0 +1,93 @@
+"""
+Production serving under gunicorn.
+
+"python server.py run" starts Flask's development server, which is a single
+process. For production use
+
+    python server.py serve --workers 8 --threads 4 0.0.0.0 8111
+
+which runs the app in several gunicorn worker processes, each with a pool of
+threads (the gthread worker, which also keeps idle HTTP connections open for
+--keepalive seconds). gunicorn has to be installed: pip install gunicorn.
+
+Each worker imports server.py itself after it is forked, so it gets its own
+engine and connection pool. With --preload the app is imported once in the
+master instead, and post_fork() makes every worker drop the connections it
+inherited and build a fresh engine.
+
+Graceful reload: send SIGHUP to the master (its pid is printed at startup and
+written to --pid if given). It starts new workers with the current code and
+lets the old ones finish their requests before they exit. This does not pick
+up code changes when --preload is used.
+"""
+import os
+import sys
+
+try:
+	from gunicorn.app.base import BaseApplication
+except ImportError:
+	BaseApplication = object
+	HAVE_GUNICORN = False
+else:
+	HAVE_GUNICORN = True
+
+
+def post_fork(arbiter, worker):
+	"""
+	gunicorn hook, run in each worker right after it is forked.
+	"""
+	server = sys.modules.get("server")
+	if server is not None:
+		server.init_worker()
+
+
+def when_ready(arbiter):
+	print("serving with %d workers, master pid %d (kill -HUP %d to reload)" % (
+		arbiter.num_workers, arbiter.pid, arbiter.pid))
+
+
+class ProductionServer(BaseApplication):
+	"""
+	Runs server:app under gunicorn with the options given, without a config file.
+	"""
+
+	def __init__(self, options):
+		self.options = options
+		super().__init__()
+
+	def load_config(self):
+		for key, value in self.options.items():
+			self.cfg.set(key, value)
+
+	def load(self):
+		# imported here, not passed in, so workers (and reloads) load the module themselves
+		import server
+		return server.app
+
+
+def serve(host, port, workers=None, threads=4, keepalive=5, timeout=30,
+		graceful_timeout=30, max_requests=0, preload=False, pidfile=None):
+	"""
+	Runs the app under gunicorn until the master is stopped.
+	"""
+	if not HAVE_GUNICORN:
+		raise RuntimeError("serve needs gunicorn, install it with: pip install gunicorn")
+	# the module is served as "server", so it must be importable from here
+	sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+	options = {
+		"bind": "%s:%d" % (host, port),
+		"workers": workers or os.cpu_count() or 1,
+		"worker_class": "gthread",
+		"threads": threads,
+		"keepalive": keepalive,
+		"timeout": timeout,
+		"graceful_timeout": graceful_timeout,
+		"max_requests": max_requests,
+		"max_requests_jitter": max_requests // 10,
+		"preload_app": preload,
+		"pidfile": pidfile,
+		"accesslog": "-",
+		"post_fork": post_fork,
+		"when_ready": when_ready,
+	}
+	ProductionServer(options).run()